@@ -1,12 +1,17 @@
 import base64
+import concurrent.futures
+import copy
 import datetime
+import functools
 import json
+import locale
 import os
 import re
+import sys
+import threading
 from typing import Optional
 
 import markdown
-import pytz
 import streamlit as st
 
 # If you install the source code instead of the `knowledge-storm` package,
@@ -19,6 +24,46 @@ from knowledge_storm.rm import YouRM
 from knowledge_storm.storm_wiki.modules.callback import BaseCallbackHandler
 from stoc import stoc
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    from zoneinfo import ZoneInfo
+
+    _CALIFORNIA_TZ = ZoneInfo('America/Los_Angeles')
+except (ImportError, KeyError):  # No zoneinfo module, or no tz database available to it.
+    import pytz
+
+    _CALIFORNIA_TZ = pytz.timezone('America/Los_Angeles')
+
+# Files read by DemoFileIOHelper.assemble_article_data; their modification times key its cache.
+_ARTICLE_DATA_FILE_NAMES = ("storm_gen_article.txt", "storm_gen_article_polished.txt", "url_to_info.json",
+                            "conversation_log.json")
+_BASE64_READ_CHUNK_SIZE = 57 * 1024
+_CITATION_WITH_SPACE_RE = re.compile(r" \[\d+")
+_CITATION_RE = re.compile(r"\[\d+")
+_QUOTED_CITATION_TITLE_RE = re.compile(r']:\s+"(.*?)"\s+http')
+# Finds citations like [i]
+_INLINE_CITATION_RE = re.compile(r'\[(\d+)\]')
+# Parsed JSON files keyed by path, holding ((st_mtime_ns, st_size), content); see DemoFileIOHelper.read_json_file.
+# Shared by all Streamlit session threads, so access goes through the lock.
+_JSON_READ_CACHE = {}
+_JSON_READ_CACHE_LOCK = threading.Lock()
+_JSON_READ_CACHE_MAX_SIZE = 32
+# Threaded directory scanning tends to be slower than a sequential scan on macOS file systems.
+_PARALLEL_TOPIC_SCAN = sys.platform != "darwin"
+# Below this many topics the thread pool setup costs more than it saves.
+_PARALLEL_TOPIC_SCAN_MIN_TOPICS = 8
+_UNIX_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_SMALL_TXT_FILE_MAX_SIZE = 64 * 1024
+# url_to_info.json files larger than this are stream-parsed instead of loaded whole.
+_STREAMING_JSON_MIN_SIZE = 1 << 20
+
 
 class DemoFileIOHelper():
     @staticmethod
@@ -35,17 +80,17 @@ class DemoFileIOHelper():
             dict: A dictionary where each key is an article name, and each value is a dictionary
                 of file names and their absolute paths within that article's directory.
         """
-        articles_dict = {}
-        for topic_name in os.listdir(articles_root_path):
-            topic_path = os.path.join(articles_root_path, topic_name)
-            if os.path.isdir(topic_path):
-                # Initialize or update the dictionary for the topic
-                articles_dict[topic_name] = {}
-                # Iterate over all files within a topic directory
-                for file_name in os.listdir(topic_path):
-                    file_path = os.path.join(topic_path, file_name)
-                    articles_dict[topic_name][file_name] = os.path.abspath(file_path)
-        return articles_dict
+        # Scanning a normalized absolute root makes every entry.path absolute, so no per-file abspath call is needed.
+        articles_root_path = os.path.abspath(articles_root_path)
+        with os.scandir(articles_root_path) as topic_entries:
+            topic_paths = {topic_entry.name: topic_entry.path for topic_entry in topic_entries if topic_entry.is_dir()}
+
+        # Scan topic directories concurrently to overlap the blocking directory reads on slow storage.
+        if _PARALLEL_TOPIC_SCAN and len(topic_paths) >= _PARALLEL_TOPIC_SCAN_MIN_TOPICS:
+            max_workers = min(32, (os.cpu_count() or 1) * 4, len(topic_paths))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                return dict(zip(topic_paths, executor.map(_read_directory_file_paths, topic_paths.values())))
+        return {topic_name: _read_directory_file_paths(topic_path) for topic_name, topic_path in topic_paths.items()}
 
     @staticmethod
     def read_txt_file(file_path):
@@ -58,24 +103,77 @@ class DemoFileIOHelper():
         Returns:
             str: The content of the file as a single string.
         """
-        with open(file_path) as f:
+        fd = os.open(file_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            size = os.fstat(fd).st_size
+            # Small files are read with a single os.read, skipping the buffered text IO layers.
+            if 0 < size <= _SMALL_TXT_FILE_MAX_SIZE:
+                data = os.read(fd, size)
+                if len(data) == size:
+                    text = data.decode(locale.getpreferredencoding(False))
+                    # Apply the same universal newline translation as open().
+                    if "\r" in text:
+                        text = text.replace("\r\n", "\n").replace("\r", "\n")
+                    return text
+                os.lseek(fd, 0, os.SEEK_SET)
+            # Larger files get a buffered read on the fd that is already open; the file object now owns it.
+            f = open(fd, closefd=True)
+            fd = None
+        finally:
+            if fd is not None:
+                os.close(fd)
+        with f:
             return f.read()
 
     @staticmethod
-    def read_json_file(file_path):
+    def read_json_file(file_path, use_cache=False):
         """
         Reads a JSON file and returns its content as a Python dictionary or list,
         depending on the JSON structure.
 
         Args:
             file_path (str): The path to the JSON file to be read.
+            use_cache (bool): Whether to serve the file from an in-memory cache while it
+                              is unchanged. Meant for files that are reread across
+                              Streamlit reruns, such as conversation_log.json.
 
         Returns:
             dict or list: The content of the JSON file. The type depends on the
                         structure of the JSON file (object or array at the root).
+                        With use_cache, the returned object is a shallow copy of the
+                        cached one.
         """
-        with open(file_path) as f:
-            return json.load(f)
+        if use_cache:
+            file_stat = os.stat(file_path)
+            file_signature = (file_stat.st_mtime_ns, file_stat.st_size)
+            with _JSON_READ_CACHE_LOCK:
+                cached = _JSON_READ_CACHE.get(file_path)
+            if cached is not None and cached[0] == file_signature:
+                return copy.copy(cached[1])
+
+        if orjson is not None:
+            # orjson parses the raw bytes directly, skipping the text decoding layer.
+            with open(file_path, "rb") as f:
+                data = f.read()
+            try:
+                content = orjson.loads(data)
+            except orjson.JSONDecodeError:
+                # orjson rejects some input json accepts, e.g. lone surrogate escapes such as "\udc80"
+                # that json.dump writes for scraped text.
+                content = json.loads(data.decode("utf-8"))
+        else:
+            with open(file_path) as f:
+                content = json.load(f)
+        if not use_cache:
+            return content
+
+        with _JSON_READ_CACHE_LOCK:
+            _JSON_READ_CACHE.pop(file_path, None)
+            if len(_JSON_READ_CACHE) >= _JSON_READ_CACHE_MAX_SIZE:
+                # Evict the oldest entry (dicts keep insertion order).
+                del _JSON_READ_CACHE[next(iter(_JSON_READ_CACHE))]
+            _JSON_READ_CACHE[file_path] = (file_signature, content)
+        return copy.copy(content)
 
     @staticmethod
     def read_image_as_base64(image_path):
@@ -91,11 +189,12 @@ class DemoFileIOHelper():
             str: The base64 encoded string of the image, prefixed with the necessary
                 data URI scheme for images.
         """
+        data = bytearray(b"data:image/png;base64,")
         with open(image_path, "rb") as f:
-            data = f.read()
-            encoded = base64.b64encode(data)
-        data = "data:image/png;base64," + encoded.decode("utf-8")
-        return data
+            # Chunk size is a multiple of 3 so each encoded chunk has no padding and concatenates cleanly.
+            while chunk := f.read(_BASE64_READ_CHUNK_SIZE):
+                data += base64.b64encode(chunk)
+        return data.decode("ascii")
 
     @staticmethod
     def set_file_modification_time(file_path, modification_time_string):
@@ -106,12 +205,14 @@ class DemoFileIOHelper():
             file_path (str): The path to the file.
             modification_time_string (str): The desired modification time in 'YYYY-MM-DD HH:MM:SS' format.
         """
-        california_tz = pytz.timezone('America/Los_Angeles')
         modification_time = datetime.datetime.strptime(modification_time_string, '%Y-%m-%d %H:%M:%S')
-        modification_time = california_tz.localize(modification_time)
-        modification_time_utc = modification_time.astimezone(datetime.timezone.utc)
-        modification_timestamp = modification_time_utc.timestamp()
-        os.utime(file_path, (modification_timestamp, modification_timestamp))
+        if hasattr(_CALIFORNIA_TZ, 'localize'):  # pytz fallback
+            modification_time = _CALIFORNIA_TZ.localize(modification_time)
+        else:
+            modification_time = modification_time.replace(tzinfo=_CALIFORNIA_TZ)
+        # Integer nanoseconds since the epoch, computed without a float round-trip.
+        modification_time_ns = (modification_time - _UNIX_EPOCH) // datetime.timedelta(microseconds=1) * 1000
+        os.utime(file_path, ns=(modification_time_ns, modification_time_ns))
 
     @staticmethod
     def get_latest_modification_time(path):
@@ -124,28 +225,16 @@ class DemoFileIOHelper():
         Returns:
             str: The latest file's modification time in 'YYYY-MM-DD HH:MM:SS' format.
         """
-        california_tz = pytz.timezone('America/Los_Angeles')
-        latest_mod_time = None
-
-        file_paths = []
         if os.path.isdir(path):
-            for root, dirs, files in os.walk(path):
-                for file in files:
-                    file_paths.append(os.path.join(root, file))
+            modification_timestamps = _iter_file_modification_timestamps(path)
         else:
-            file_paths = [path]
-
-        for file_path in file_paths:
-            modification_timestamp = os.path.getmtime(file_path)
-            modification_time_utc = datetime.datetime.utcfromtimestamp(modification_timestamp)
-            modification_time_utc = modification_time_utc.replace(tzinfo=datetime.timezone.utc)
-            modification_time_california = modification_time_utc.astimezone(california_tz)
+            modification_timestamps = [os.path.getmtime(path)]
 
-            if latest_mod_time is None or modification_time_california > latest_mod_time:
-                latest_mod_time = modification_time_california
+        # Compare raw timestamps and only convert the latest one to a California datetime.
+        latest_timestamp = max(modification_timestamps, default=None)
 
-        if latest_mod_time is not None:
-            return latest_mod_time.strftime('%Y-%m-%d %H:%M:%S')
+        if latest_timestamp is not None:
+            return datetime.datetime.fromtimestamp(latest_timestamp, tz=_CALIFORNIA_TZ).strftime('%Y-%m-%d %H:%M:%S')
         else:
             return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
@@ -156,7 +245,8 @@ class DemoFileIOHelper():
         based on the available files in the article's directory. This includes the
         main article text, citations from a JSON file, and a conversation log if
         available. The function prioritizes a polished version of the article if
-        both a raw and polished version exist.
+        both a raw and polished version exist. Results are cached until one of the
+        underlying files is modified.
 
         Args:
             article_file_paths (dict): A dictionary where keys are file names relevant
@@ -170,25 +260,36 @@ class DemoFileIOHelper():
                         if neither the raw nor polished article text exists in the
                         provided file paths.
         """
-        if "storm_gen_article.txt" in article_file_path_dict or "storm_gen_article_polished.txt" in article_file_path_dict:
-            full_article_name = "storm_gen_article_polished.txt" if "storm_gen_article_polished.txt" in article_file_path_dict else "storm_gen_article.txt"
-            article_data = {"article": DemoTextProcessingHelper.parse(
-                DemoFileIOHelper.read_txt_file(article_file_path_dict[full_article_name]))}
-            if "url_to_info.json" in article_file_path_dict:
-                article_data["citations"] = _construct_citation_dict_from_search_result(
-                    DemoFileIOHelper.read_json_file(article_file_path_dict["url_to_info.json"]))
-            if "conversation_log.json" in article_file_path_dict:
-                article_data["conversation_log"] = DemoFileIOHelper.read_json_file(
-                    article_file_path_dict["conversation_log.json"])
-            return article_data
-        return None
+        article_files_key = tuple((file_name, file_path, os.stat(file_path).st_mtime_ns)
+                                  for file_name, file_path in article_file_path_dict.items()
+                                  if file_name in _ARTICLE_DATA_FILE_NAMES)
+        article_data = DemoFileIOHelper._assemble_article_data_from_files(article_files_key)
+        # Hand out a shallow copy so callers adding or replacing keys do not alter the cached entry.
+        return dict(article_data) if article_data is not None else None
+
+    @staticmethod
+    @functools.lru_cache(maxsize=128)
+    def _assemble_article_data_from_files(article_files_key):
+        article_file_path_dict = {file_name: file_path for file_name, file_path, _ in article_files_key}
+        full_article_path = (article_file_path_dict.get("storm_gen_article_polished.txt")
+                             or article_file_path_dict.get("storm_gen_article.txt"))
+        if full_article_path is None:
+            return None
+        article_data = {"article": DemoTextProcessingHelper.parse(DemoFileIOHelper.read_txt_file(full_article_path))}
+        url_to_info_path = article_file_path_dict.get("url_to_info.json")
+        if url_to_info_path is not None:
+            article_data["citations"] = _read_citation_list_from_search_result_file(url_to_info_path)
+        conversation_log_path = article_file_path_dict.get("conversation_log.json")
+        if conversation_log_path is not None:
+            article_data["conversation_log"] = DemoFileIOHelper.read_json_file(conversation_log_path, use_cache=True)
+        return article_data
 
 
 class DemoTextProcessingHelper():
 
     @staticmethod
     def remove_citations(sent):
-        return re.sub(r"\[\d+", "", re.sub(r" \[\d+", "", sent)).replace(" |", "").replace("]", "")
+        return _CITATION_RE.sub("", _CITATION_WITH_SPACE_RE.sub("", sent)).replace(" |", "").replace("]", "")
 
     @staticmethod
     def parse_conversation_history(json_data):
@@ -215,8 +316,7 @@ class DemoTextProcessingHelper():
 
     @staticmethod
     def parse(text):
-        regex = re.compile(r']:\s+"(.*?)"\s+http')
-        text = regex.sub(']: http', text)
+        text = _QUOTED_CITATION_TITLE_RE.sub(']: http', text)
         return text
 
     @staticmethod
@@ -244,9 +344,8 @@ class DemoTextProcessingHelper():
         Returns:
             str: The current California time in 'YYYY-MM-DD HH:MM:SS' format.
         """
-        california_tz = pytz.timezone('America/Los_Angeles')
         utc_now = datetime.datetime.now(datetime.timezone.utc)
-        california_now = utc_now.astimezone(california_tz)
+        california_now = utc_now.astimezone(_CALIFORNIA_TZ)
         return california_now.strftime('%Y-%m-%d %H:%M:%S')
 
     @staticmethod
@@ -270,18 +369,17 @@ class DemoTextProcessingHelper():
         return time1 == time2
 
     @staticmethod
-    def add_inline_citation_link(article_text, citation_dict):
-        # Regular expression to find citations like [i]
-        pattern = r'\[(\d+)\]'
-
+    def add_inline_citation_link(article_text, citation_list):
         # Function to replace each citation with its Markdown link
         def replace_with_link(match):
             i = match.group(1)
-            url = citation_dict.get(int(i), {}).get('url', '#')
+            index = int(i)
+            citation = citation_list[index] if citation_list and 0 < index < len(citation_list) else None
+            url = citation['url'] if citation is not None else '#'
             return f'[[{i}]]({url})'
 
         # Replace all citations in the text with Markdown links
-        return re.sub(pattern, replace_with_link, article_text)
+        return _INLINE_CITATION_RE.sub(replace_with_link, article_text)
 
     @staticmethod
     def generate_html_toc(md_text):
@@ -400,37 +498,111 @@ class DemoUIHelper():
         """
 
 
-def _construct_citation_dict_from_search_result(search_results):
+def _construct_citation_list(url_to_unified_index, url_to_info):
+    # Citation indices start from 1, so slot 0 is left as None and citation_list[i] holds citation [i].
+    citation_list = [None] * (max(url_to_unified_index.values(), default=0) + 1)
+    for url, index in url_to_unified_index.items():
+        info = url_to_info[url]
+        citation_list[index] = {'url': url, 'title': info['title'], 'snippets': info['snippets']}
+    return citation_list
+
+
+def _construct_citation_list_from_search_result(search_results):
     if search_results is None:
         return None
-    citation_dict = {}
-    for url, index in search_results['url_to_unified_index'].items():
-        citation_dict[index] = {'url': url,
-                                'title': search_results['url_to_info'][url]['title'],
-                                'snippets': search_results['url_to_info'][url]['snippets']}
-    return citation_dict
+    return _construct_citation_list(search_results['url_to_unified_index'], search_results['url_to_info'])
+
+
+def _read_citation_list_from_search_result_file(url_to_info_path):
+    # The pure-Python ijson backends are far slower than json.load, so only stream with the C backend.
+    if (ijson is None or ijson.backend != "yajl2_c"
+            or os.path.getsize(url_to_info_path) <= _STREAMING_JSON_MIN_SIZE):
+        return _construct_citation_list_from_search_result(DemoFileIOHelper.read_json_file(url_to_info_path))
+    # Stream large files in a single pass so the full search result tree is never held in memory at once.
+    # Only the title and snippets of each url_to_info entry are kept; like the in-memory path, a missing
+    # field raises KeyError in _construct_citation_list.
+    url_to_unified_index = {}
+    url_to_info = {}
+    url = info = title_prefix = snippets_prefix = None
+    try:
+        with open(url_to_info_path, "rb") as f:
+            for prefix, event, value in ijson.parse(f, use_float=True):
+                if event == "map_key":
+                    if prefix == "url_to_unified_index":
+                        url = value
+                    elif prefix == "url_to_info":
+                        url = value
+                        info = url_to_info[url] = {}
+                        title_prefix = f"url_to_info.{url}.title"
+                        snippets_prefix = f"url_to_info.{url}.snippets"
+                elif event == "string":
+                    if prefix == title_prefix:
+                        info['title'] = value
+                    elif prefix == f"{snippets_prefix}.item":
+                        info['snippets'].append(value)
+                elif event == "null" and prefix == title_prefix:
+                    info['title'] = None
+                elif event == "start_array" and prefix == snippets_prefix:
+                    info['snippets'] = []
+                elif event == "number" and prefix == f"url_to_unified_index.{url}":
+                    url_to_unified_index[url] = value
+    except (ijson.JSONError, UnicodeDecodeError):
+        # yajl cannot decode some escapes json.dump writes (e.g. lone surrogates such as "\udc80").
+        return _construct_citation_list_from_search_result(DemoFileIOHelper.read_json_file(url_to_info_path))
+    return _construct_citation_list(url_to_unified_index, url_to_info)
+
+
+def _read_directory_file_paths(directory_path):
+    """
+    Returns a dictionary mapping the name of every entry in the given directory to its path.
+    """
+    with os.scandir(directory_path) as entries:
+        return {entry.name: entry.path for entry in entries}
+
+
+def _iter_file_modification_timestamps(directory_path):
+    """
+    Yields the modification timestamp of every file under the given directory, recursively.
+    Like os.walk, symlinked directories are not descended into.
+    """
+    if hasattr(os, "fwalk"):
+        # Stat files relative to their directory's fd so the kernel resolves only the file name.
+        for _, _, file_names, directory_fd in os.fwalk(directory_path):
+            for file_name in file_names:
+                yield os.stat(file_name, dir_fd=directory_fd).st_mtime
+        return
+    with os.scandir(directory_path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    yield from _iter_file_modification_timestamps(entry.path)
+            else:
+                yield entry.stat().st_mtime
 
 
-def _display_main_article_text(article_text, citation_dict, table_content_sidebar):
+def _display_main_article_text(article_text, citation_list, table_content_sidebar):
     # Post-process the generated article for better display.
     if "Write the lead section:" in article_text:
         article_text = article_text[
                        article_text.find("Write the lead section:") + len("Write the lead section:"):]
     if article_text[0] == '#':
-        article_text = '\n'.join(article_text.split('\n')[1:])
-    article_text = DemoTextProcessingHelper.add_inline_citation_link(article_text, citation_dict)
+        # Drop the title line without splitting and re-joining the whole article.
+        article_text = article_text.partition('\n')[2]
+    article_text = DemoTextProcessingHelper.add_inline_citation_link(article_text, citation_list)
     # '$' needs to be changed to '\$' to avoid being interpreted as LaTeX in st.markdown()
     article_text = article_text.replace("$", "\\$")
     stoc.from_markdown(article_text, table_content_sidebar)
 
 
-def _display_references(citation_dict):
-    if citation_dict:
-        reference_list = [f"reference [{i}]" for i in range(1, len(citation_dict) + 1)]
-        selected_key = st.selectbox("Select a reference", reference_list)
-        citation_val = citation_dict[reference_list.index(selected_key) + 1]
-        citation_val['title'] = citation_val['title'].replace("$", "\\$")
-        st.markdown(f"**Title:** {citation_val['title']}")
+def _display_references(citation_list):
+    # citation_list[0] is an unused placeholder; citation [i] is citation_list[i].
+    reference_indices = [i for i in range(1, len(citation_list or [])) if citation_list[i] is not None]
+    if reference_indices:
+        selected_index = st.selectbox("Select a reference", reference_indices,
+                                      format_func=lambda i: f"reference [{i}]")
+        citation_val = citation_list[selected_index]
+        title = citation_val['title'].replace("$", "\\$")
+        st.markdown(f"**Title:** {title}")
         st.markdown(f"**Url:** {citation_val['url']}")
         snippets = '\n\n'.join(citation_val['snippets']).replace("$", "\\$")
         st.markdown(f"**Highlights:**\n\n {snippets}")
@@ -446,12 +618,12 @@ def _display_persona_conversations(conversation_log):
     parsed_conversation_history = DemoTextProcessingHelper.parse_conversation_history(conversation_log)
     # construct tabs for each persona conversation
     persona_tabs = st.tabs([name for (name, _, _) in parsed_conversation_history])
-    for idx, persona_tab in enumerate(persona_tabs):
+    for persona_tab, (_, persona_description, conversation) in zip(persona_tabs, parsed_conversation_history):
         with persona_tab:
             # show persona description
-            st.info(parsed_conversation_history[idx][1])
+            st.info(persona_description)
             # show user / agent utterance in dialogue UI
-            for message in parsed_conversation_history[idx][2]:
+            for message in conversation:
                 message['content'] = message['content'].replace("$", "\\$")
                 with st.chat_message(message["role"]):
                     if message["role"] == "user":
@@ -466,14 +638,14 @@ def _display_main_article(selected_article_file_path_dict, show_reference=True,
     with st.container(height=1000, border=True):
         table_content_sidebar = st.sidebar.expander("**Table of contents**", expanded=True)
         _display_main_article_text(article_text=article_data.get("article", ""),
-                                   citation_dict=article_data.get("citations", {}),
+                                   citation_list=article_data.get("citations", []),
                                    table_content_sidebar=table_content_sidebar)
 
     # display reference panel
     if show_reference and "citations" in article_data:
         with st.sidebar.expander("**References**", expanded=True):
             with st.container(height=800, border=False):
-                _display_references(citation_dict=article_data.get("citations", {}))
+                _display_references(citation_list=article_data.get("citations", []))
 
     # display conversation history
     if show_conversation and "conversation_log" in article_data:
@@ -483,6 +655,7 @@ def _display_main_article(selected_article_file_path_dict, show_reference=True,
             _display_persona_conversations(conversation_log=article_data.get("conversation_log", {}))
 
 
+@functools.cache
 def get_demo_dir():
     return os.path.dirname(os.path.abspath(__file__))
 
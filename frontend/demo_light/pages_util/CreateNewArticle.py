@@ -66,7 +66,8 @@ def create_new_article_page():
             )
             conversation_log_path = os.path.join(st.session_state["page3_current_working_dir"],
                                                  st.session_state["page3_topic_name_cleaned"], "conversation_log.json")
-            demo_util._display_persona_conversations(DemoFileIOHelper.read_json_file(conversation_log_path))
+            demo_util._display_persona_conversations(
+                DemoFileIOHelper.read_json_file(conversation_log_path, use_cache=True))
             st.session_state["page3_write_article_state"] = "final_writing"
             status.update(label="brain**STORM**ing complete!", state="complete")
 